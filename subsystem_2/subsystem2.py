@@ -1,16 +1,98 @@
-import copy
+import bisect
+import collections
+import itertools
 import math
+import random
 from pprint import pprint
 from timeit import default_timer as timer
 
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the kernels run as plain python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# largest floor count the precomputed travel time tables cover (the
+# building modelled in the notebooks has 50 floors)
+MAX_FLOORS = 50
+
+# action flags returned by _step_lifts for each lift
+BOARD = 1
+DEPART = 2
+ARRIVE = 4
+
+
+@njit(cache=True)
+def _travel_time(dist, smv, tmv, vmax, td, acc):
+    """Scalar travel time for a distance in metres, compiled so callers
+    outside the precomputed table range avoid interpreter overhead."""
+    # travel distance is sufficient to reach max v
+    if dist > 2*smv:
+        return 2*tmv + (dist - 2*smv)/vmax + 2*td
+    # travel distance is not sufficient to reach max v
+    return 2*td + 2*math.sqrt(dist/acc)
+
+
+@njit(cache=True)
+def _cum_travel(floors, tt, df, smv, tmv, vmax, td, acc):
+    """Cumulative travel times through the given floors, sorted into visiting
+    order, with each hop looked up from the lift's travel time table. Hops
+    beyond the table are computed from the kinematics like travel_time does."""
+    floors = np.sort(floors)
+    times = np.empty(floors.shape[0])
+    t = 0.0
+    times[0] = 0.0
+    for i in range(1, floors.shape[0]):
+        n = floors[i]-floors[i-1]
+        if n < tt.shape[0]:
+            t += tt[n]
+        else:
+            t += _travel_time(df*n, smv, tmv, vmax, td, acc)
+        times[i] = t
+    return times
+
+
+@njit(cache=True)
+def _step_lifts(available, arrival_times, queue_lens, passenger_counts,
+                last_enter, capacities, thresholds, clock):
+    """Decides the per-second action for every lift from the struct-of-arrays
+    state mirror. Mirrors the logic of Lift.check_departure/check_arrival but
+    runs as one compiled pass instead of per-lift method dispatch."""
+    actions = np.zeros(available.shape[0], dtype=np.int8)
+    for i in range(available.shape[0]):
+        if available[i]:
+            n = passenger_counts[i]
+            boarded = False
+            if queue_lens[i] > 0:
+                if n < capacities[i]:
+                    actions[i] = BOARD
+                    n += 1
+                    boarded = True
+                else:
+                    # lift must depart
+                    actions[i] = DEPART
+                    continue
+            if n >= thresholds[i]*capacities[i]:
+                actions[i] |= DEPART
+            elif not boarded and n > 0 and clock - last_enter[i] > 10:
+                # depart after 10 seconds of waiting
+                actions[i] |= DEPART
+        else:
+            if clock == arrival_times[i]:
+                actions[i] = ARRIVE
+    return actions
+
 
 class Lift:
     """The Lift class helps to define mechanical characteristics of a single lift unit.
     The helper methods allow travel times and other characterstics to be computed."""
 
-    def __init__(self, id=None, capacity=8, vmax=5.0, acc=1.0, door_time=0.0, floor_height=4.0, capacity_threshold = 1.0):
+    def __init__(self, id=None, capacity=8, vmax=5.0, acc=1.0, door_time=0.0, floor_height=4.0, capacity_threshold = 1.0, history_size=60*60):
         self.id = id
         self.capacity = capacity
         self.vmax = vmax
@@ -21,17 +103,41 @@ class Lift:
         self.smv = self.vmax**2 / (2*self.acc)  # distance to reach max v
         self.tmv = self.vmax / self.acc         # time to reach max v
 
+        # precompute travel times for every possible floor delta so the
+        # hot paths can index a table rather than redo the kinematics
+        self._tt = np.array([self._comp_travel_time(n)
+                             for n in range(MAX_FLOORS+1)])
+
         self.available = True
         self.arrival_time = 0
         self.passengers = []
         self.passenger_travel_times = []
         self.rtt = None
-        self.queue = []
+        self.queue = collections.deque()
         self.loc_history = [(0,0)]
 
+        # running destination totals so get_avg_floor does not have to
+        # traverse passengers and queue on every call
+        self._p_dest_sum = 0
+        self._q_dest_sum = 0
+        # most recently queued destinations, newest last; only the last
+        # (total % capacity) of these are relevant to a full lift
+        self._recent_dests = collections.deque(maxlen=self.capacity)
+        # boarding time of the most recently added passenger; the clock is
+        # monotonic so this is always the max over the passenger list
+        self._last_enter_time = 0
+        # destinations of the onboard passengers as a parallel array, so
+        # departures can sort and accumulate trip times without touching
+        # the dicts; the first len(passengers) entries are valid
+        self._p_dest = np.empty(self.capacity, dtype=np.int32)
+
         self.history = {
             'queue_length':[]
         }
+        # queue length per second, preallocated and indexed by the clock;
+        # trimmed into the history dict by finalize_history after a run
+        self._qhist = np.zeros(history_size, dtype=np.int32)
+        self._qhist_i = 0
 
         self.printing = False
 
@@ -68,27 +174,25 @@ class Lift:
 
     def get_avg_floor(self):
         """Calculates average destination floor for relevant subset of passengers that the next added passenger will travel with."""
-        running_order = self.passengers + self.queue
-        total = len(running_order)
+        total = len(self.passengers) + len(self.queue)
 
         if total == 0:
             return 0
 
         if total < self.capacity:
-            return sum([p['destination'] for p in running_order])/total # average destination
-        
+            return (self._p_dest_sum + self._q_dest_sum)/total # average destination
+
         else:
-            div = total // self.capacity # calculate remainder
-            # relevant passengers to caller
-            relevant_ps = running_order[div*self.capacity:]
-            if len(relevant_ps) == 0:
+            rem = total % self.capacity # calculate remainder
+            if rem == 0:
                 return 0  # avg floor is irrelevant to the caller
             else:
-                return sum([p['destination'] for p in relevant_ps])/len(relevant_ps) # average
+                # the remainder passengers are the most recently queued
+                return sum(itertools.islice(reversed(self._recent_dests), rem))/rem # average
 
     def get_ett(self, passenger):
         """Calculates the expected travel time of passenger"""
-        running_order = self.passengers + self.queue
+        running_order = self.passengers + list(self.queue)
         total = len(running_order)
         if total == 0:
             flrs = [0, passenger['destination']]
@@ -108,7 +212,7 @@ class Lift:
 
     def get_ewt(self):
         """Gets current expected waiting time for lift"""
-        running_order = self.passengers + self.queue
+        running_order = self.passengers + list(self.queue)
         total = len(running_order)
         if total == 0:
             return 0
@@ -135,69 +239,80 @@ class Lift:
         """travel_time(n) calculates total time taken (seconds) to travel n integer floors this included closing of the doors and opening at the destination.
 
         """
-        dist = self.df*n
-
-        # travel distance is sufficient to reach max v
-        if dist > 2*self.smv:
-            return 2*self.tmv + (dist - 2*self.smv)/self.vmax + 2*self.td
+        if 0 <= n <= MAX_FLOORS:
+            return self._tt[n]
+        return self._comp_travel_time(n)
 
-        # travel distance is not sufficient to reach max v
-        elif dist <= 2*self.smv:
-            return 2*self.td + 2*math.sqrt(dist/self.acc)
-
-        else:
-            raise ValueError()
+    def _comp_travel_time(self, n):
+        """Computes the travel time for n floors from the lift kinematics. Used to build the lookup table; travel_time should be used instead."""
+        return _travel_time(self.df*n, self.smv, self.tmv,
+                            self.vmax, self.td, self.acc)
 
     def comp_travel(self, floors):
-        """Calculates travel times taken to reach each target floor. List must include starting floor. Corresponding travel time for that floor will be 0. The floors must be in correct order."""
-
-        floors.sort()
-        time = 0
-        times = [time]
-        prev_n = floors[0]
-        for n in floors[1:]:
-            time += self.travel_time(n-prev_n)
-            times.append(time)
-            prev_n = n
-        return times
+        """Calculates travel times taken to reach each target floor. The sequence must include the starting floor, whose travel time will be 0. Accepts a list or array of floors and returns the cumulative times as an array."""
+
+        return _cum_travel(np.asarray(floors, dtype=np.int32), self._tt,
+                           self.df, self.smv, self.tmv,
+                           self.vmax, self.td, self.acc)
 
     def update_trip_times(self, clock):
         """Updates time stamp of passengers for duration of travel time and returns the round trip time of the lift to the caller"""
         # sort the passengers in order of requested floor
-        self.passengers = sorted(self.passengers, key=lambda p: p['destination'])
-
-        time = 0
-        prev_n = 0 # start at ground floor
+        dests = self._p_dest[:len(self.passengers)]
+        order = np.argsort(dests, kind='stable')
+        self.passengers = [self.passengers[i] for i in order]
+        sorted_dests = dests[order]
+        dests[:] = sorted_dests  # keep the array aligned with the list
 
         self.loc_history.append((clock, 0))
 
-        # move to each floor
-        for p in self.passengers:
-            n = p['destination']
-            time += self.travel_time(n-prev_n)
-            p['time.travelling'] = time
-            self.passenger_travel_times.append(time)
-            self.loc_history.append((time+clock, n))
-            prev_n = n
-        
+        # cumulative time at each floor visited, ending back at ground
+        deltas = np.abs(np.diff(np.concatenate(((0,), sorted_dests, (0,)))))
+        hops = self._tt[np.minimum(deltas, MAX_FLOORS)]
+        over = deltas > MAX_FLOORS
+        if over.any():
+            # hops beyond the table fall back to the kinematics, as
+            # travel_time does
+            hops[over] = [self._comp_travel_time(n) for n in deltas[over]]
+        times = np.cumsum(hops).tolist()
+
+        for i, p in enumerate(self.passengers):
+            p['time.travelling'] = times[i]
+
+        self.passenger_travel_times.extend(times[:-1])
+        self.loc_history.extend(zip((t+clock for t in times[:-1]),
+                                    sorted_dests.tolist()))
+
         # return to ground
-        n = 0
-        time += self.travel_time(abs(0-prev_n))
-        self.loc_history.append((time+clock, n))
-        
-        return time # RTT
+        self.loc_history.append((times[-1]+clock, 0))
+
+        return times[-1] # RTT
 
-    def update(self):
+    def update(self, clock):
         """Housekeeping tasks for lift object"""
-        self.history['queue_length'].append(len(self.queue))
+        self._qhist[clock] = len(self.queue)
+        self._qhist_i = clock + 1
+
+    def fill_history(self, clock):
+        """Holds the current queue length over any seconds skipped since the
+        last update. Must run before this second's assignments change the
+        queue, since the skipped seconds saw its post-action length."""
+        i = self._qhist_i
+        if clock > i:
+            self._qhist[i:clock] = len(self.queue)
+            self._qhist_i = clock
+
+    def finalize_history(self, clock):
+        """Fills the queue history up to the given clock and publishes it in
+        the history dict"""
+        self.fill_history(clock)
+        self.history['queue_length'] = self._qhist[:self._qhist_i]
     
     def check_departure(self, clock):
         """Will load any waiting passengers into the lift until full. Will depart when at full capacity, or when reached the departure threshold and there are no waiting passengers."""
         if len(self.queue) > 0:
             if len(self.passengers) < self.capacity:
-                passenger = self.queue.pop(0)
-                passenger['time.enter_lift'] = clock
-                self.add_passenger(passenger)
+                self.board_next(clock)
             else:
                 # lift must depart
                 self.depart(clock)
@@ -209,11 +324,17 @@ class Lift:
 
         # depart if waiting for too long
         if len(self.passengers) > 0:
-            recent_p = max(self.passengers, key=lambda p: p['time.enter_lift'])
-            waiting_time = clock - recent_p['time.enter_lift']
+            waiting_time = clock - self._last_enter_time
             if waiting_time > 10: # depart after 10 seconds of waiting
                 self.depart(clock)
 
+    def board_next(self, clock):
+        """Moves the passenger at the front of the queue into the lift"""
+        passenger = self.queue.popleft()
+        self._q_dest_sum -= passenger['destination']
+        passenger['time.enter_lift'] = clock
+        self.add_passenger(passenger)
+
     def depart(self, clock):
         """Handles the departure of the lift."""
         # leaving lobby so cannot accept passengers
@@ -223,8 +344,10 @@ class Lift:
             p['time.departure'] = clock
         # update trip times for all passengers and return RTT for lift
         self.rtt = self.update_trip_times(clock)
-        # set when lift will next be available in the lobby
-        self.arrival_time = math.ceil(clock + self.rtt)
+        # set when lift will next be available in the lobby; clock is an
+        # integer so this is ceil(clock + rtt) without the math.ceil call
+        rtt_i = int(self.rtt)
+        self.arrival_time = clock + rtt_i + (self.rtt > rtt_i)
         self.log("Lift {} is departing. RTT = {} ETA: {}".format(
                 self.id, self.rtt, self.arrival_time))
 
@@ -233,8 +356,10 @@ class Lift:
         if current_time == self.arrival_time:
             for p in self.passengers:
                 p['time.arrival'] = current_time 
-            completed_passengers = self.passengers.copy()
-            self.passengers = [] # clear the passenger list
+            # hand over the list itself rather than copying it
+            completed_passengers = self.passengers
+            self.passengers = [] # start a fresh passenger list
+            self._p_dest_sum = 0
             self.available = True
             self.log("Lift {} has arrived back at lobby and available to use.".format(self.id))
             return completed_passengers
@@ -244,7 +369,11 @@ class Lift:
     def add_passenger(self, passenger):
         """Boards a passenger onto the lift"""
         if len(self.passengers) < self.capacity and self.available:
+            self._p_dest[len(self.passengers)] = passenger['destination']
             self.passengers.append(passenger)
+            self._p_dest_sum += passenger['destination']
+            self._last_enter_time = passenger.get('time.enter_lift',
+                                                  self._last_enter_time)
             self.log("Lift {} just added passenger going to floor {}".format(self.id, passenger['destination']))
             return True
         else:
@@ -255,6 +384,8 @@ class Lift:
         passenger['time.lobby'] = clock
         passenger['lift.id'] = self.id
         self.queue.append(passenger)
+        self._q_dest_sum += passenger['destination']
+        self._recent_dests.append(passenger['destination'])
         self.log("A passenger is waiting to get into Lift {}".format(self.id))
         if len(self.queue) > 10:
             self.log("  ALERT > There are more than 10 people waiting to get in the lift")
@@ -272,21 +403,46 @@ class Simulation:
         self.traffic = None
         self.assignment_func = None
         self.arrivals = []
-        self.q = []
+        self.q = collections.deque()
         self.lifts = []
         self.assignment_times = []
+        # timing every assignment call costs two timer reads per passenger,
+        # so it is off unless profiling is wanted
+        self.profile_assignments = False
+        # per-second assignment rates, generated in one batch on first use
+        self._rates = None
         for i in range(self.number_of_lifts):
             self.lifts.append(Lift(id=i,
                                    capacity=self.lift_capacity,
-                                   capacity_threshold=self.departure_capacity_threshold))
+                                   capacity_threshold=self.departure_capacity_threshold,
+                                   history_size=self.iterations))
 
         for lift in self.lifts:
             lift.set_print(False)
 
+        # struct-of-arrays mirror of the per-lift state that the compiled
+        # step kernel reads; kept in sync on every queue/board/depart/arrive
+        n = self.number_of_lifts
+        self._available = np.ones(n, dtype=np.bool_)
+        self._arrival_times = np.zeros(n)
+        self._queue_lens = np.zeros(n, dtype=np.int32)
+        self._passenger_counts = np.zeros(n, dtype=np.int32)
+        self._last_enter = np.zeros(n)
+        self._capacities = np.array([l.capacity for l in self.lifts],
+                                    dtype=np.int32)
+        self._thresholds = np.array([l.capacity_threshold for l in self.lifts])
+        self._avg_floors = np.zeros(n)
+
     def set_traffic(self, t):
         """Takes a complete unique copy of the passenger traffic data provided for the simulation"""
         self.total_traffic = len(t)
-        self.traffic = copy.deepcopy(t)
+        # passenger records are flat dicts that only ever gain new keys, so
+        # copying each dict is enough; a deepcopy of the whole list is not
+        self.traffic = [dict(p) for p in t]
+        # parallel list of start times so step can bisect for everyone who
+        # has arrived by the current clock instead of popping one at a time
+        self._traffic_starts = [p['time.start'] for p in self.traffic]
+        self._traffic_idx = 0
 
     def set_assignment_func(self, name):
         """Assigns common assignment allocation names to function handles in the class"""
@@ -307,93 +463,98 @@ class Simulation:
             raise ValueError(
                 'The assignment func name \'{}\' is not recognised.'.format(name))
 
+    def _enqueue(self, lift, passenger):
+        """Queues the passenger on the lift and keeps the state mirror in sync"""
+        lift.queue_passenger(passenger, self.clock)
+        self._queue_lens[lift.id] += 1
+        self._avg_floors[lift.id] = lift.get_avg_floor()
+
     def assign_greedy(self, passenger):
         """Assignment method assigns passenger to the lift with the shortest queue"""
         # assign to the shortest lift queue
-        lifts_by_queue_length = sorted(
-            self.lifts, key=lambda lift: lift.get_queue_length())
-        lifts_by_queue_length[0].queue_passenger(passenger, self.clock)
+        shortest = self.lifts[self._queue_lens.argmin()]
+        self._enqueue(shortest, passenger)
 
     def assign_nearest_lift(self, passenger):
         """Assigns passenger to lift in order of soonest arrival time in the lobby, as long as the queue length is less than the lift capacity. If this fails, falls back to 'greedy' assignment."""
         # assign to the queue of nearest lift unless the queue has reached capacity
-        lifts_by_proximity = sorted(
-            self.lifts, key=lambda lift: lift.get_arrival_time())
-        for lift in lifts_by_proximity:
-            if lift.get_queue_length() < lift.capacity:
-                lift.queue_passenger(passenger, self.clock)
-                return
+        free = self._queue_lens < self._capacities
+        if free.any():
+            nearest = np.where(free, self._arrival_times, np.inf).argmin()
+            self._enqueue(self.lifts[nearest], passenger)
+            return
 
         # all lift queues are at least as long as lift capacity
         self.assign_greedy(passenger)
 
     def assign_grouping(self, passenger):
         """Assigns passenger based on if the lift with the nearest mean average destination is within a certain threshold. If not it may try to assign the passenger to an empty lift."""
-        # order lifts by the average destination floor of each lift
+        # distance between passenger destination floor and average
+        # destination floor of each lift
+        dists = np.abs(self._avg_floors - passenger['destination'])
+        best = dists.argmin()
 
         # establish lifts that will have no other passengers yet
-        empty_lifts = [l for l in self.lifts if l.get_avg_floor() == 0]
-
-        # order lifts by the distance between passenger destination floor
-        # and average destination floor of each lift
-        lbnaf = sorted(self.lifts, key=lambda lift: abs(
-            lift.get_avg_floor()-passenger['destination']))
+        empty = self._avg_floors == 0
 
         # best case, there is empty lift to fall back on
-        if len(empty_lifts) > 0:
-            if abs(lbnaf[0].get_avg_floor()-passenger['destination']) < 5:
+        if empty.any():
+            if dists[best] < 5:
                 # if best lift is within a 5 floor threshold, then add the passenger
-                lbnaf[0].queue_passenger(passenger, self.clock)
+                self._enqueue(self.lifts[best], passenger)
                 return
             else:
                 # revert to just assigning them to their own lift
-                empty_lifts[0].queue_passenger(passenger, self.clock)
+                self._enqueue(self.lifts[empty.argmax()], passenger)
                 return
 
         # no free lifts, so we put them in the most suitable one
         else:
-            lbnaf[0].queue_passenger(passenger, self.clock)
+            self._enqueue(self.lifts[best], passenger)
             return
 
     def assign_random(self, passenger):
         """Randomly assigns passenger to a lift"""
-        # assign to a random lift
-        r = np.random.randint(0, self.number_of_lifts)
-        self.lifts[r].queue_passenger(passenger, self.clock)
+        # assign to a random lift; randrange is much cheaper than a numpy
+        # scalar draw for a single value
+        r = random.randrange(self.number_of_lifts)
+        self._enqueue(self.lifts[r], passenger)
 
     def assign_journeytime(self, passenger):
         """Assigns passenger to lift with the smallest expected journey time (travel + waiting)"""
         lifts_ett = sorted(self.lifts, key=lambda l: l.get_ett(passenger)+l.get_ewt())
-        lifts_ett[0].queue_passenger(passenger, self.clock)
+        self._enqueue(lifts_ett[0], passenger)
         
     def assign_grouping_advanced(self, passenger):
         """Assigns passengers to non-full lifts if grouping matches. If not, tries to find an empty lift. Then will try to group with the available queues of lifts. Then tries to find assign to a queue that is empty. Fallback is to assign to shortest queue."""
-        # order lifts by the average destination floor of each lift
+        # a single pass over the lifts evaluates all three tiers at once;
+        # a non-full lift that groups (or is empty) wins outright, otherwise
+        # the first tier-two match and the shortest queue are remembered
+        dest = passenger['destination']
+        t2_pick = None
+        shortest_queue = None
+        shortest_total = None
 
-        t1 = [l for l in self.lifts if len(l.passengers) < l.capacity]
-        t2 = [l for l in self.lifts if len(l.passengers)+len(l.queue) < 2*l.capacity]
+        for lift in self.lifts:
+            total = len(lift.passengers) + len(lift.queue)
+            avg = self._avg_floors[lift.id]
+            near = abs(avg-dest) < 5
 
-        for lift in t1:
-            avg = lift.get_avg_floor()
-            if abs(avg-passenger['destination']) < 5:
-                lift.queue_passenger(passenger, self.clock)
-                return
-            if  avg == 0:
-                lift.queue_passenger(passenger, self.clock)
+            if len(lift.passengers) < lift.capacity and (near or avg == 0):
+                self._enqueue(lift, passenger)
                 return
+            if t2_pick is None and total < 2*lift.capacity and (near or total <= lift.capacity):
+                t2_pick = lift
+            if shortest_queue is None or total < shortest_total:
+                shortest_queue = lift
+                shortest_total = total
+
+        if t2_pick is not None:
+            self._enqueue(t2_pick, passenger)
+            return
 
-        for l in t2:
-            avg = l.get_avg_floor()
-            if abs(avg-passenger['destination']) < 5:
-                l.queue_passenger(passenger, self.clock)
-                return
-            if len(l.passengers)+len(l.queue) <= l.capacity:
-                l.queue_passenger(passenger, self.clock)
-                return
-        
         # fallback
-        shortest_queue = sorted(self.lifts, key=lambda l: len(l.passengers)+len(l.queue))[0]
-        shortest_queue.queue_passenger(passenger, self.clock)
+        self._enqueue(shortest_queue, passenger)
 
     def run(self):
         """Main simulation run method. Simulation runs and then a report is printed"""
@@ -411,6 +572,10 @@ class Simulation:
                 print("All traffic has arrived. Ending simulation early.")
                 break
 
+        # publish the queue histories, held over any trailing skipped seconds
+        for lift in self.lifts:
+            lift.finalize_history(self.clock)
+
         message = []
         message.append("SIMULATION COMPLETE")
         message.append("Assignment function:      {}".format(self.func_name))
@@ -428,42 +593,113 @@ class Simulation:
             print("│ "+line.ljust(lline)+" │")
         print("└"+"─" * (lline+2) + "┘")
 
+    def _next_clock(self):
+        """Finds the next second at which any lift or passenger can act, so
+        the run loop can skip over idle stretches like a discrete-event
+        scheduler. Falls back to the next second whenever per-second
+        behaviour (assignment or boarding) is still pending."""
+        nxt = self.clock + 1
+        # pending lobby passengers are assigned every second
+        if len(self.q) > 0:
+            return nxt
+
+        events = []
+        if self._traffic_idx < len(self._traffic_starts):
+            events.append(self._traffic_starts[self._traffic_idx])
+        for lift in self.lifts:
+            if lift.available:
+                # available lifts with a queue board every second
+                if len(lift.queue) > 0:
+                    return nxt
+                # a lift holding passengers departs once they have waited
+                # more than 10 seconds
+                if len(lift.passengers) > 0:
+                    events.append(lift._last_enter_time + 11)
+            else:
+                events.append(lift.arrival_time)
+
+        if len(events) == 0:
+            # nothing is due; tick normally so run's completion check can
+            # end the simulation at the true duration
+            return nxt
+        return min(max(nxt, int(min(events))), self.iterations)
+
     def step(self):
         """Method called for each step of the simulation loop"""
+        # QUEUE HISTORIES
+        # hold the queue lengths over any skipped seconds before this
+        # second's assignments change them
+        for lift in self.lifts:
+            lift.fill_history(self.clock)
+
         # NEW ARRIVALS
-        # move new arrivals from traffic into the queue
-        while len(self.traffic) > 0:
-            user = self.traffic[0]
-            if user['time.start'] > self.clock:
-                break  # user has not arrived at building yet
-            else:
-                # user has arrived at the building
-                self.q.append(self.traffic.pop(0))
+        self._drain_arrivals()
 
         # ASSIGNMENT ALGORITHM
-        # Assign each person in the queue according to limits
-        # 2 to 4 people per second can be allocated a lift
-        for _ in range(np.random.randint(2, 5)):
-            if len(self.q) > 0:
-                waiting_passenger = self.q.pop(0)  # remove from the queue
-                start = timer()
-                self.assignment_func(waiting_passenger)  # assign passenger
-                end = timer()
-                self.assignment_times.append(end-start)
-            else:
-                break
+        self._assign_batch()
 
         # UPDATE THE LIFT STATES
-        # Check departure/arrival for all lifts
-        for lift in self.lifts:
-            lift.update()
-            if lift.is_available():
-                lift.check_departure(self.clock)
-            else:
-                self.arrivals += lift.check_arrival(self.clock)
+        self._update_lifts()
 
         # ITERATE THE CLOCK
-        self.clock += 1
+        # jump straight to the next second at which anything can happen
+        self.clock = self._next_clock()
+
+    def _drain_arrivals(self):
+        """Moves everyone who has arrived at the building by now into the lobby queue"""
+        end = bisect.bisect_right(self._traffic_starts, self.clock,
+                                  self._traffic_idx)
+        if end > self._traffic_idx:
+            self.q.extend(self.traffic[self._traffic_idx:end])
+            self._traffic_idx = end
+
+    def _assign_batch(self):
+        """Assigns waiting passengers to lifts according to limits: 2 to 4
+        people per second can be allocated a lift. The rates are drawn in one
+        batch rather than per step."""
+        if self._rates is None:
+            self._rates = np.random.randint(2, 5, size=self.iterations)
+
+        # bind the hot names once rather than per passenger
+        q = self.q
+        assign = self.assignment_func
+        for _ in range(self._rates[self.clock]):
+            if len(q) > 0:
+                waiting_passenger = q.popleft()  # remove from the queue
+                if self.profile_assignments:
+                    start = timer()
+                    assign(waiting_passenger)  # assign passenger
+                    self.assignment_times.append(timer()-start)
+                else:
+                    assign(waiting_passenger)  # assign passenger
+            else:
+                break
+
+    def _update_lifts(self):
+        """Decides boarding/departure/arrival for all lifts in one compiled
+        pass over the state mirror, then applies the actions to the objects"""
+        clock = self.clock
+        actions = _step_lifts(self._available, self._arrival_times,
+                              self._queue_lens, self._passenger_counts,
+                              self._last_enter, self._capacities,
+                              self._thresholds, clock)
+        for i, lift in enumerate(self.lifts):
+            lift.update(clock)
+            act = actions[i]
+            if act & BOARD:
+                lift.board_next(clock)
+                self._queue_lens[i] -= 1
+                self._passenger_counts[i] += 1
+                self._last_enter[i] = clock
+            if act & DEPART:
+                lift.depart(clock)
+                self._available[i] = False
+                self._arrival_times[i] = lift.arrival_time
+            elif act & ARRIVE:
+                self.arrivals += lift.check_arrival(clock)
+                self._available[i] = True
+                self._passenger_counts[i] = 0
+                self._avg_floors[i] = lift.get_avg_floor()
 
         # LIVE GRAPH (DEPRECATED -- UNNECESSARY)
         # ax1.clear()